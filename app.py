@@ -2,145 +2,665 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 from io import BytesIO
+import html
+from dataclasses import dataclass
 import re
+import importlib.util
 from datetime import datetime, timedelta
 import os
+import traceback
 from dotenv import load_dotenv
 
-# Load env variables
-load_dotenv()
+# pandas imports the reader engines itself, on first use
+_HAS_CALAMINE = importlib.util.find_spec('python_calamine') is not None
 
-def format_date(date_str):
-    """Convert date to DD-MMM format"""
+@st.cache_resource(show_spinner=False)
+def _load_env():
+    """Load env variables once per process rather than on every script rerun"""
+    load_dotenv()
+
+# Precompiled patterns and month lookup tables
+_MONTH_NAMES = ("Jan", "Feb", "Mar", "Apr", "May", "Jun",
+                "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+_MONTH_ARRAY = np.array(_MONTH_NAMES, dtype=object)
+_MONTH_MAP = {name: number for number, name in enumerate(_MONTH_NAMES, 1)}
+_ISO_RE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})')
+_SHORT_RE = re.compile(r"^(\d{1,2})\s+([A-Za-z]{3})[A-Za-z]*\s+'(\d{2})")
+
+# Placeholder values that count as missing data
+_NA_SET = frozenset({'#N/A', 'N/A', ''})
+
+# Extracted fields holding delivery dates, given a "_Formatted" DD-MMM copy
+_DATE_FIELDS = ('Booking Form Delivery', 'Confirmed Delivery', 'Ship Date', 'Warehouse Date')
+
+# Delivery date fallbacks for the order sheet, in priority order
+_BOOKING_DELIVERY_KEYS = ('Booking Form Delivery_Formatted', 'Ship Date_Formatted',
+                          'Booking Form Delivery', 'Ship Date')
+_CONFIRMED_DELIVERY_KEYS = ('Confirmed Delivery_Formatted', 'Warehouse Date_Formatted',
+                            'Confirmed Delivery', 'Warehouse Date')
+# The form details panel prefers a field's own raw value over the other field
+_BOOKING_DISPLAY_KEYS = ('Booking Form Delivery_Formatted', 'Booking Form Delivery',
+                         'Ship Date_Formatted', 'Ship Date')
+_CONFIRMED_DISPLAY_KEYS = ('Confirmed Delivery_Formatted', 'Confirmed Delivery',
+                           'Warehouse Date_Formatted', 'Warehouse Date')
+
+# Label patterns to look for within a form's area, per extracted field
+# (field order and pattern order set the matching priority)
+_FIELD_PATTERNS = (
+    ('Description', ('description', 'desc')),
+    ('Look', ('look',)),
+    ('Reference', ('ref',)),
+    ('Original Reference', ('original ref',)),
+    ('Supplier Reference', ('supplier ref',)),
+    ('Color', ('color', 'colour')),
+    ('Total Units', ('uk total unit buy', 'total unit')),
+    ('VCP', ('vcp',)),
+    ('Factory', ('factory name', 'factory')),
+    ('Booking Form Delivery', ('booking form delivery', 'booking delivery')),
+    ('Confirmed Delivery', ('confirmed delivery', 'confirm delivery')),
+    ('Ship Date', ('ship', 'shipping')),
+    ('Warehouse Date', ('whs', 'warehouse')),
+)
+# Matches a label containing any of the patterns above
+_LABEL_RE = re.compile('|'.join(re.escape(pattern) for _, patterns in _FIELD_PATTERNS
+                                for pattern in patterns))
+
+# Professional dark theme stylesheet, emitted on every rerun
+_CSS = """
+<style>
+@import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700;800&family=JetBrains+Mono:wght@400;500;600&display=swap');
+
+/* Global dark theme override */
+.stApp {
+    background: #0a0a0a !important;
+    color: #ffffff !important;
+}
+
+.main {
+    background: #0a0a0a !important;
+    padding: 1rem 2rem !important;
+}
+
+/* Container styling */
+.block-container {
+    background: #0a0a0a !important;
+    padding: 1rem 2rem !important;
+    max-width: 1400px !important;
+}
+
+/* Override all white backgrounds */
+div[data-testid="stAppViewContainer"] {
+    background: #0a0a0a !important;
+}
+
+div[data-testid="stHeader"] {
+    background: transparent !important;
+}
+
+section[data-testid="stSidebar"] {
+    background: #111111 !important;
+}
+
+/* Content wrapper */
+.block-container {
+    background: transparent;
+    padding-top: 1rem;
+    padding-bottom: 1rem;
+}
+
+/* Hide default Streamlit elements */
+#MainMenu {visibility: hidden;}
+footer {visibility: hidden;}
+header {visibility: hidden;}
+
+/* Professional main title */
+.main-title {
+    font-family: 'Inter', sans-serif;
+    font-size: 2.8rem;
+    font-weight: 800;
+    color: #ffffff;
+    text-align: center;
+    margin: 1.5rem 0 0.5rem 0;
+    letter-spacing: -0.02em;
+    text-shadow: 0 2px 4px rgba(0, 0, 0, 0.3);
+}
+
+@keyframes gradientShift {
+    0% { background-position: 0% 50%; }
+    50% { background-position: 100% 50%; }
+    100% { background-position: 0% 50%; }
+}
+
+/* Professional subtitle */
+.sub-title {
+    font-family: 'Inter', sans-serif;
+    font-size: 1.1rem;
+    color: #94a3b8;
+    text-align: center;
+    margin-bottom: 2rem;
+    font-weight: 400;
+    letter-spacing: 0.01em;
+}
+
+/* Professional card styling */
+.modern-card {
+    background: #1a1a1a;
+    border: 1px solid #2d2d2d;
+    border-radius: 12px;
+    padding: 1.5rem;
+    margin: 1rem 0;
+    box-shadow: 0 4px 12px rgba(0, 0, 0, 0.1);
+    transition: all 0.3s ease;
+}
+
+.modern-card:hover {
+    border-color: #3b82f6;
+    box-shadow: 0 8px 24px rgba(0, 0, 0, 0.2);
+    transform: translateY(-1px);
+}
+
+/* Professional success message */
+.success-message {
+    background: #065f46;
+    border: 1px solid #10b981;
+    border-radius: 8px;
+    padding: 1rem 1.5rem;
+    text-align: center;
+    font-weight: 500;
+    color: #d1fae5;
+    font-family: 'Inter', sans-serif;
+    margin: 1rem 0;
+}
+
+@keyframes pulse {
+    0% { box-shadow: 0 0 20px rgba(0, 255, 128, 0.3); }
+    50% { box-shadow: 0 0 30px rgba(0, 255, 128, 0.5); }
+    100% { box-shadow: 0 0 20px rgba(0, 255, 128, 0.3); }
+}
+
+/* Professional info message */
+.info-message {
+    background: #1e3a8a;
+    border: 1px solid #3b82f6;
+    border-radius: 8px;
+    padding: 1rem 1.5rem;
+    text-align: center;
+    font-weight: 500;
+    color: #dbeafe;
+    font-family: 'Inter', sans-serif;
+    margin: 1rem 0;
+}
+
+/* Warning message */
+.warning-message {
+    background: linear-gradient(45deg, rgba(255, 165, 0, 0.1), rgba(255, 69, 0, 0.1));
+    border: 2px solid #ff8c00;
+    border-radius: 15px;
+    padding: 1.5rem;
+    text-align: center;
+    font-weight: 600;
+    color: #ff8c00;
+    box-shadow: 0 0 20px rgba(255, 140, 0, 0.3);
+}
+
+/* Error message */
+.error-message {
+    background: linear-gradient(45des, rgba(255, 0, 128, 0.1), rgba(255, 0, 0, 0.1));
+    border: 2px solid #ff0080;
+    border-radius: 15px;
+    padding: 1.5rem;
+    text-align: center;
+    font-weight: 600;
+    color: #ff0080;
+    box-shadow: 0 0 20px rgba(255, 0, 128, 0.3);
+}
+
+/* Professional upload area */
+.upload-container {
+    background: #1a1a1a;
+    border: 2px dashed #374151;
+    border-radius: 12px;
+    padding: 2rem;
+    text-align: center;
+    transition: all 0.3s ease;
+    margin: 1.5rem 0;
+}
+
+.upload-container:hover {
+    border-color: #3b82f6;
+    background: #1e1e1e;
+    box-shadow: 0 4px 12px rgba(59, 130, 246, 0.1);
+}
+
+/* File uploader styling */
+.stFileUploader {
+    background: transparent !important;
+}
+
+.stFileUploader > div {
+    background: #1a1a1a !important;
+    border: 2px dashed #374151 !important;
+    border-radius: 12px !important;
+    padding: 2rem !important;
+}
+
+.stFileUploader > div:hover {
+    border-color: #3b82f6 !important;
+    background: #1e1e1e !important;
+}
+
+.stFileUploader label {
+    color: #ffffff !important;
+    font-family: 'Inter', sans-serif !important;
+    font-weight: 500 !important;
+}
+
+/* Data frames and tables */
+.dataframe {
+    background: rgba(255, 255, 255, 0.05) !important;
+    color: #ffffff !important;
+    border-radius: 15px !important;
+}
+
+.dataframe th {
+    background: rgba(0, 245, 255, 0.2) !important;
+    color: #00f5ff !important;
+    border: 1px solid rgba(0, 245, 255, 0.3) !important;
+}
+
+.dataframe td {
+    background: rgba(255, 255, 255, 0.02) !important;
+    color: rgba(255, 255, 255, 0.9) !important;
+    border: 1px solid rgba(0, 245, 255, 0.1) !important;
+}
+
+/* Expander content background */
+.streamlit-expanderContent {
+    background: rgba(0, 0, 0, 0.3) !important;
+    border-radius: 0 0 15px 15px;
+}
+
+/* Stats container */
+.stats-container {
+    display: flex;
+    justify-content: space-around;
+    margin: 2rem 0;
+}
+
+.stat-item {
+    background: rgba(255, 255, 255, 0.05);
+    border: 1px solid rgba(0, 245, 255, 0.3);
+    border-radius: 15px;
+    padding: 1.5rem;
+    text-align: center;
+    min-width: 150px;
+    backdrop-filter: blur(5px);
+}
+
+.stat-number {
+    font-family: 'Orbitron', monospace;
+    font-size: 2rem;
+    font-weight: 700;
+    color: #00f5ff;
+    margin-bottom: 0.5rem;
+}
+
+.stat-label {
+    font-family: 'Roboto', sans-serif;
+    color: rgba(255, 255, 255, 0.8);
+    font-size: 0.9rem;
+}
+
+/* Professional button styling */
+.stButton > button {
+    background: #3b82f6;
+    border: none;
+    border-radius: 8px;
+    padding: 0.75rem 1.5rem;
+    font-family: 'Inter', sans-serif;
+    font-weight: 500;
+    color: white;
+    transition: all 0.2s ease;
+    font-size: 0.95rem;
+}
+
+.stButton > button:hover {
+    background: #2563eb;
+    transform: translateY(-1px);
+    box-shadow: 0 4px 12px rgba(59, 130, 246, 0.3);
+}
+
+.stDownloadButton > button {
+    background: #10b981;
+    border: none;
+    border-radius: 8px;
+    padding: 0.75rem 1.5rem;
+    font-family: 'Inter', sans-serif;
+    font-weight: 500;
+    color: white;
+    transition: all 0.2s ease;
+}
+
+.stDownloadButton > button:hover {
+    background: #059669;
+    transform: translateY(-1px);
+    box-shadow: 0 4px 12px rgba(16, 185, 129, 0.3);
+}
+
+/* Sidebar styling */
+.css-1d391kg, .css-1y4p8pa, .css-17eq0hr {
+    background: linear-gradient(180deg, #0a0a1f 0%, #1a1a2e 50%, #2d1b69 100%) !important;
+}
+
+/* Sidebar content */
+.css-1d391kg .element-container {
+    background: transparent;
+}
+
+/* Remove white backgrounds from all containers */
+.element-container, .stMarkdown, .stText {
+    background: transparent !important;
+}
+
+/* File uploader styling */
+.stFileUploader {
+    background: rgba(0, 245, 255, 0.05) !important;
+    border-radius: 15px;
+    border: 2px dashed rgba(0, 245, 255, 0.3);
+    padding: 2rem;
+}
+
+.stFileUploader label {
+    color: #00f5ff !important;
+    font-weight: 600;
+}
+
+/* Text styling */
+p, span, div {
+    color: rgba(255, 255, 255, 0.9) !important;
+}
+
+h1, h2, h3, h4, h5, h6 {
+    color: #00f5ff !important;
+}
+
+/* Remove default streamlit styling */
+.css-1v0mbdj, .css-18e3th9, .css-1d391kg {
+    background: transparent !important;
+}
+
+/* Data editor styling */
+.stDataFrame {
+    border-radius: 15px;
+    overflow: hidden;
+    box-shadow: 0 8px 32px rgba(0, 245, 255, 0.1);
+}
+
+/* Progress bar */
+.progress-container {
+    background: rgba(255, 255, 255, 0.1);
+    border-radius: 10px;
+    padding: 0.5rem;
+    margin: 1rem 0;
+}
+
+.progress-bar {
+    background: linear-gradient(90deg, #00f5ff, #8000ff);
+    height: 8px;
+    border-radius: 4px;
+    transition: width 0.3s ease;
+}
+
+/* Expander styling */
+.streamlit-expanderHeader {
+    background: rgba(0, 245, 255, 0.1);
+    border-radius: 10px;
+    border: 1px solid rgba(0, 245, 255, 0.3);
+}
+
+/* Custom text colors */
+.highlight-text {
+    color: #00f5ff;
+    font-weight: 600;
+}
+
+.accent-text {
+    color: #ff0080;
+    font-weight: 500;
+}
+
+.success-text {
+    color: #00ff80;
+    font-weight: 500;
+}
+</style>
+"""
+
+def _parse_date(value):
+    """Parse a datetime, "2025-07-19 00:00:00" or "19 Jul '25" value into a datetime"""
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str):
+        return None
     try:
-        # Handle formats like "19 Jul '25" or "2025-07-19 00:00:00"
-        if isinstance(date_str, str):
-            if "'" in date_str:  # Format like "19 Jul '25"
-                parts = date_str.split()
-                if len(parts) >= 2:
-                    return f"{parts[0]}-{parts[1]}"
-            elif "00:00:00" in date_str:  # Format like "2025-07-19 00:00:00"
-                date_part = date_str.split()[0]
-                if "-" in date_part:
-                    year, month, day = date_part.split('-')
-                    month_names = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", 
-                                  "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
-                    return f"{int(day)}-{month_names[int(month)-1]}"
-        elif isinstance(date_str, datetime):
-            return f"{date_str.day}-{date_str.strftime('%b')}"
-    except Exception as e:
+        # ISO dates first - the cheaper, digits-only pattern
+        match = _ISO_RE.match(value)
+        if match:
+            return datetime(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        match = _SHORT_RE.match(value)
+        if match:
+            month = _MONTH_MAP.get(match.group(2).title())
+            if month:
+                return datetime(2000 + int(match.group(3)), month, int(match.group(1)))
+    except ValueError:
         pass
+    return None
+
+def format_date(date_str):
+    """Convert date to DD-MMM format"""
+    parsed = _parse_date(date_str)
+    if parsed is not None:
+        return f"{parsed.day}-{_MONTH_NAMES[parsed.month-1]}"
+    # Other apostrophe dates such as "Jul '25" keep their first two words
+    if isinstance(date_str, str) and "'" in date_str:
+        parts = date_str.split()
+        if len(parts) >= 2:
+            return f"{parts[0]}-{parts[1]}"
     return ""
 
-def find_booking_forms(df):
-    """Find all booking forms in the Excel sheet"""
-    booking_forms = []
+@dataclass(slots=True)
+class Lot:
+    """A lot within a booking form; form-level fields are shared with the form, not copied"""
+    form: dict
+    lot_number: int = 1
+    units: str = ''
+    ship_formatted: str = ''
+
+def _cell_text(value):
+    """Return the stripped text of a cell value, or "" for an empty cell"""
+    # Most label/value cells are strings, so check that before the NaN test;
+    # numbers and datetimes never carry surrounding whitespace
+    if isinstance(value, str):
+        return value.strip()
+    return str(value) if pd.notna(value) else ""
+
+# Lowercased text of a string cell; numbers, dates and blanks cannot hold a label
+_lower_label = np.frompyfunc(lambda value: value.lower() if isinstance(value, str) else "", 1, 1)
+
+def _normalize(values):
+    """Lowercase the label text of a sheet's filled cells, as row-major (rows, cols, texts)"""
+    # Sheets are mostly blank; only keep the filled positions, so memory follows
+    # the filled cells rather than the sheet size times its longest cell
+    rows, cols = np.nonzero(pd.notna(values))
+    texts = _lower_label(values[rows, cols]).tolist()
+    return rows, cols, texts
+
+def _format_dates(values):
+    """Convert a batch of raw date values to DD-MMM format"""
+    if not values:
+        return []
     
-    # Look for "Booking Form" text to identify each form
-    for row in range(df.shape[0]):
-        for col in range(df.shape[1]):
-            cell_value = str(df.iloc[row, col]).strip().lower() if pd.notna(df.iloc[row, col]) else ""
-            if 'booking form' in cell_value:
-                booking_forms.append({'start_row': row, 'start_col': col})
+    # Parse both known layouts with explicit formats (pandas' C fast path);
+    # datetime cells pass straight through either parser
+    raw = pd.Series(values, dtype=object)
+    parsed = pd.to_datetime(raw, format='%Y-%m-%d %H:%M:%S', errors='coerce').combine_first(
+        pd.to_datetime(raw, format="%d %b '%y", errors='coerce'))
     
-    return booking_forms
+    # Format the parsed dates column-wise; the day is built from .dt.day as
+    # strftime's unpadded-day directive differs between platforms
+    formatted = np.full(len(values), "", dtype=object)
+    valid = parsed.notna().to_numpy()
+    if valid.any():
+        dates = parsed[valid].dt
+        formatted[valid] = dates.day.astype(str).to_numpy() + "-" + _MONTH_ARRAY[dates.month.to_numpy() - 1]
+    
+    # Anything neither format matched falls back to the scalar parser
+    for i in np.flatnonzero(~valid):
+        formatted[i] = format_date(values[i])
+    
+    return formatted.tolist()
 
-def extract_single_form_data(df, form_start_row, form_start_col):
-    """Extract data from a single booking form starting at given position"""
+def find_booking_forms(df, norm=None):
+    """Find all booking forms in the Excel sheet"""
+    # Look for "Booking Form" text to identify each form with one pass over
+    # the normalised filled cells (hits come back row-major)
+    if norm is None:
+        norm = _normalize(df.to_numpy(dtype=object))
+    rows, cols, texts = norm
+    
+    return [{'start_row': int(rows[i]), 'start_col': int(cols[i])}
+            for i, text in enumerate(texts) if 'booking form' in text]
+
+def _find_labels(norm):
+    """Locate the cells containing any field pattern, as row-major (rows, cols, texts)"""
+    # One pass of the compiled alternation over the sheet's filled cells
+    rows, cols, texts = norm
+    hits = np.fromiter((_LABEL_RE.search(text) is not None for text in texts), dtype=bool, count=len(texts))
+    return rows[hits], cols[hits], [text for text, hit in zip(texts, hits) if hit]
+
+def extract_single_form_data(df, form_start_row, form_start_col, sheet=None):
+    """Extract data from a single booking form; returns (base_data, lot_data, raw_dates)"""
     base_data = {}
     lot_data = []
+    date_cells = {}  # Raw datetime cells, formatted without a str() round trip
+    
+    # Cell values and label cells of the whole sheet, shared by every form
+    if sheet is None:
+        values = df.to_numpy(dtype=object)
+        sheet = (values,) + _find_labels(_normalize(values))
+    values, label_rows, label_cols, label_texts = sheet
     
-    # Define the search area for this form (typically 50 rows down from start)
-    search_end_row = min(form_start_row + 50, df.shape[0])
+    # Define the search area for this form (typically 50 rows down from start),
+    # with values read up to 3 columns right of the label columns
+    label_start_col = max(0, form_start_col - 2)
+    label_end_col = min(form_start_col + 8, df.shape[1])
+    value_end_col = min(label_end_col + 3, df.shape[1])
     
-    # Look for key fields within this form's area
-    field_patterns = {
-        'Description': ['description', 'desc'],
-        'Look': ['look'],
-        'Reference': ['ref'],
-        'Original Reference': ['original ref'],
-        'Supplier Reference': ['supplier ref'],
-        'Color': ['color', 'colour'],
-        'Total Units': ['uk total unit buy', 'total unit'],
-        'VCP': ['vcp'],
-        'Factory': ['factory name', 'factory'],
-        'Booking Form Delivery': ['booking form delivery', 'booking delivery'],
-        'Confirmed Delivery': ['confirmed delivery', 'confirm delivery'],
-        'Ship Date': ['ship', 'shipping'],
-        'Warehouse Date': ['whs', 'warehouse'],
-    }
+    # Label cells inside the search area, still in row-major order
+    first, last = np.searchsorted(label_rows, [form_start_row, form_start_row + 50])
+    candidates = [(row, col, label_texts[i])
+                  for i, row, col in zip(range(first, last), label_rows[first:last].tolist(),
+                                         label_cols[first:last].tolist())
+                  if label_start_col <= col < label_end_col]
+    if not candidates:
+        return None, [], {}  # No field labels anywhere in the search area
     
     # Extract base information for this form
-    for field, patterns in field_patterns.items():
+    for field, patterns in _FIELD_PATTERNS:
         for pattern in patterns:
             found = False
-            for row in range(form_start_row, search_end_row):
-                for col in range(max(0, form_start_col - 2), min(form_start_col + 8, df.shape[1])):
-                    cell_value = str(df.iloc[row, col]).strip().lower() if pd.notna(df.iloc[row, col]) else ""
-                    if pattern in cell_value:
-                        # Look for the actual value in adjacent cells
-                        for offset in [1, 2, 3]:
-                            if col + offset < df.shape[1]:
-                                value_cell = df.iloc[row, col + offset]
-                                if pd.notna(value_cell) and str(value_cell).strip() and str(value_cell).strip() != '#N/A':
-                                    base_data[field] = str(value_cell).strip()
-                                    found = True
-                                    break
-                        if found:
+            # Label cells containing the pattern, in row-major order
+            for row, col, label in candidates:
+                if pattern not in label:
+                    continue
+                # Look for the actual value in adjacent cells
+                for offset in [1, 2, 3]:
+                    if col + offset < value_end_col:
+                        value_cell = values[row, col + offset]
+                        value_text = _cell_text(value_cell)
+                        if value_text and value_text != '#N/A':
+                            base_data[field] = value_text
+                            if isinstance(value_cell, datetime):
+                                date_cells[field] = value_cell
+                            found = True
                             break
                 if found:
                     break
             if found:
                 break
     
-    # Process and format delivery dates
-    for date_field in ['Booking Form Delivery', 'Confirmed Delivery', 'Ship Date', 'Warehouse Date']:
-        if date_field in base_data:
-            raw_date = base_data[date_field]
-            formatted_date = format_date(raw_date)
-            if formatted_date:
-                base_data[f'{date_field}_Formatted'] = formatted_date
+    # Raw delivery date values; the caller must run _format_dates on them to
+    # fill the *_Formatted fields, batching all forms at once
+    raw_dates = {field: date_cells.get(field, base_data[field])
+                 for field in _DATE_FIELDS
+                 if field in base_data}
     
     # Check if this form has any valid data (not empty/N/A)
-    if not base_data or all(val in ['#N/A', '', 'N/A'] for val in base_data.values()):
-        return None, []  # Skip empty forms
+    if not base_data or _NA_SET.issuperset(base_data.values()):
+        return None, [], {}  # Skip empty forms
     
-    return base_data, lot_data
+    return base_data, lot_data, raw_dates
 
 def extract_multi_lot_data(df):
     """Extract data from multiple booking forms in the same Excel sheet"""
     all_base_data = []
     all_lot_data = []
     
+    # Normalise the sheet and tag its label cells once, rather than per form
+    values = df.to_numpy(dtype=object)
+    norm = _normalize(values)
+    sheet = (values,) + _find_labels(norm)
+    
     # Find all booking forms in the sheet
-    booking_forms = find_booking_forms(df)
+    booking_forms = find_booking_forms(df, norm)
     
     if not booking_forms:
         # Fallback: treat entire sheet as single form
         booking_forms = [{'start_row': 0, 'start_col': 0}]
     
+    # (base_data, field, raw value) for every delivery date found
+    pending_dates = []
+    
     # Process each booking form
     for i, form_info in enumerate(booking_forms):
-        form_base_data, form_lot_data = extract_single_form_data(
-            df, form_info['start_row'], form_info['start_col']
+        form_base_data, form_lot_data, form_dates = extract_single_form_data(
+            df, form_info['start_row'], form_info['start_col'], sheet
         )
         
         if form_base_data:  # Only add if form has valid data
             # Add form identifier
             form_base_data['Form_Number'] = i + 1
             all_base_data.append(form_base_data)
+            pending_dates.extend((form_base_data, field, raw) for field, raw in form_dates.items())
             
             # If no lot data, create at least one entry from base data
             if not form_lot_data:
-                lot_entry = dict(form_base_data)
-                lot_entry['Lot Number'] = 1
-                all_lot_data.append(lot_entry)
+                all_lot_data.append(Lot(form_base_data))
             else:
                 all_lot_data.extend(form_lot_data)
     
+    # Process and format the delivery dates of every form in one batch
+    formatted_dates = _format_dates([raw for _, _, raw in pending_dates])
+    for (base_data, field, _), formatted_date in zip(pending_dates, formatted_dates):
+        if formatted_date:
+            base_data[f'{field}_Formatted'] = formatted_date
+    
     # Return combined data from all forms
     return all_base_data, all_lot_data
 
+def _read_sheet(file_bytes, ext):
+    """Read the first sheet into an object DataFrame of raw cell values"""
+    if _HAS_CALAMINE:
+        # Rust-backed reader for both formats, several times faster than
+        # openpyxl on xlsx and than xlrd on xls
+        return pd.read_excel(BytesIO(file_bytes), header=None, engine='calamine', dtype=object)
+    
+    if ext == 'xls':
+        return pd.read_excel(BytesIO(file_bytes), header=None, engine='xlrd', dtype=object)
+    
+    # Fallback: openpyxl through pandas, keeping the raw cell values
+    return pd.read_excel(BytesIO(file_bytes), header=None, engine='openpyxl', dtype=object)
+
 def process_form_data(base_data_list):
     """Process extracted data from multiple forms"""
     processed_data = []
@@ -148,26 +668,49 @@ def process_form_data(base_data_list):
     for base_data in base_data_list:
         # Process factory name
         if 'Factory' in base_data:
-            factory_value = base_data['Factory']
-            if '[' in factory_value:
-                parts = factory_value.split('[')
-                if len(parts) >= 2:
-                    base_data['Factory'] = parts[0].strip()
-                    base_data['Factory ID'] = parts[1].replace(']', '').strip()
+            # "Name [ID]": split at the first bracket without building a list
+            factory_name, bracket, factory_rest = base_data['Factory'].partition('[')
+            if bracket:
+                base_data['Factory'] = factory_name.strip()
+                base_data['Factory ID'] = factory_rest.partition('[')[0].replace(']', '').strip()
+        
+        # Display form used by the order sheets, built once per form
+        factory_id = base_data.get('Factory ID', '')
+        base_data['Factory Display'] = (f"{base_data.get('Factory', '')} - {factory_id}" if factory_id
+                                        else base_data.get('Factory', ''))
         
         # Process color
         if 'Color' in base_data:
-            color_value = base_data['Color']
-            if '[' in color_value:
-                base_data['Color'] = color_value.split('[')[0].strip()
-                color_code = re.search(r'\[(.*?)\]', color_value)
-                if color_code:
-                    base_data['Color Code'] = color_code.group(1)
+            color_name, bracket, color_rest = base_data['Color'].partition('[')
+            if bracket:
+                base_data['Color'] = color_name.strip()
+                # The code is the bracketed text, when the bracket is closed
+                color_code, closed, _ = color_rest.partition(']')
+                if closed:
+                    base_data['Color Code'] = color_code
         
         processed_data.append(base_data)
     
     return processed_data
 
+@st.cache_data(show_spinner=False, max_entries=8)
+def _load_and_extract(file_bytes, ext):
+    """Read the uploaded workbook, extract and process its booking forms, cached on the file bytes"""
+    df = _read_sheet(file_bytes, ext)
+    base_data_list, lot_data = extract_multi_lot_data(df)
+    # Lots share their form's dict, so processing here also updates lot_data
+    return df, process_form_data(base_data_list), lot_data
+
+def _sum_total_units(base_data_list):
+    """Sum the forms' whole-number Total Units, ignoring thousands separators"""
+    total = 0
+    for base_data in base_data_list:
+        units = base_data.get('Total Units', '0').replace(',', '')
+        # isdecimal rather than isdigit: int() rejects digits such as '²'
+        if units.isdecimal():
+            total += int(units)
+    return total
+
 def create_order_details_output(base_data, lot_data):
     """Create order details output sheet with one row per lot"""
     
@@ -182,27 +725,29 @@ def create_order_details_output(base_data, lot_data):
         # Return empty dataframe with headers only
         return pd.DataFrame(columns=order_details_cols)
     
-    # Create Sheet 1 - one row per lot
-    order_rows = []
+    # Create Sheet 1 - one row per lot, built column-wise
+    cols = {c: [] for c in order_details_cols}
     for lot in lot_data:
-        row = {
-            'IMAGE': '',
-            'SUPPLIER REFERENCE': lot.get('Reference', '').upper(),
-            'DESCRIPTION': lot.get('Description', ''),
-            'COLOUR': lot.get('Color', 'TBC'),
-            'UNITS': lot.get('Units', ''),
-            'BOOKING FORM DELIVERY': lot.get('Ship Date Formatted', ''),
-            'CONFIRMED DELIVERY': lot.get('Ship Date Formatted', ''),  # Same as booking form delivery
-            'VCP': lot.get('VCP', ''),
-            'FACTORY': lot.get('Factory', '') + " - " + lot.get('Factory ID', '') if lot.get('Factory ID', '') else lot.get('Factory', ''),
-            'FABRIC COMP': '',  # Blank value as requested
-            'SUSTAINABLE MESSAGE': '',  # Blank value as requested
-            'COST': '',  # Blank value as requested
-            'REMARKS': ''
-        }
-        order_rows.append(row)
+        form = lot.form
+        cols['IMAGE'].append('')
+        cols['SUPPLIER REFERENCE'].append(form.get('Reference', '').upper())
+        cols['DESCRIPTION'].append(form.get('Description', ''))
+        cols['COLOUR'].append(form.get('Color', 'TBC'))
+        cols['UNITS'].append(lot.units)
+        cols['BOOKING FORM DELIVERY'].append(lot.ship_formatted)
+        cols['CONFIRMED DELIVERY'].append(lot.ship_formatted)  # Same as booking form delivery
+        cols['VCP'].append(form.get('VCP', ''))
+        cols['FACTORY'].append(form.get('Factory Display', ''))
+        cols['FABRIC COMP'].append('')  # Blank value as requested
+        cols['SUSTAINABLE MESSAGE'].append('')  # Blank value as requested
+        cols['COST'].append('')  # Blank value as requested
+        cols['REMARKS'].append('')
     
-    return pd.DataFrame(order_rows)
+    return pd.DataFrame(cols, columns=order_details_cols)
+
+def _first_value(data, keys, default):
+    """Return the first non-empty value among keys, or default"""
+    return next((value for value in map(data.get, keys) if value), default)
 
 def create_order_details_output_multi_form(base_data_list):
     """Create order details output sheet with one row per booking form"""
@@ -218,46 +763,90 @@ def create_order_details_output_multi_form(base_data_list):
         # Return empty dataframe with headers only
         return pd.DataFrame(columns=order_details_cols)
     
-    # Create one row per booking form
-    order_rows = []
+    # Create one row per booking form, built column-wise
+    cols = {c: [] for c in order_details_cols}
     for i, base_data in enumerate(base_data_list, 1):
         # Skip forms with N/A or empty data
         if (not base_data or 
-            base_data.get('Description', '') in ['#N/A', 'N/A', ''] or
-            all(val in ['#N/A', 'N/A', ''] for val in base_data.values() if val)):
+            base_data.get('Description', '') in _NA_SET or
+            _NA_SET.issuperset(filter(None, base_data.values()))):
             continue
             
         # Get delivery dates with fallback logic
-        booking_delivery = (base_data.get('Booking Form Delivery_Formatted') or 
-                          base_data.get('Ship Date_Formatted') or 
-                          base_data.get('Booking Form Delivery') or 
-                          base_data.get('Ship Date') or '')
+        booking_delivery = _first_value(base_data, _BOOKING_DELIVERY_KEYS, '')
+        confirmed_delivery = _first_value(base_data, _CONFIRMED_DELIVERY_KEYS,
+                                          booking_delivery)  # Use booking delivery as fallback
+        reference = base_data.get('Reference')
         
-        confirmed_delivery = (base_data.get('Confirmed Delivery_Formatted') or 
-                            base_data.get('Warehouse Date_Formatted') or 
-                            base_data.get('Confirmed Delivery') or 
-                            base_data.get('Warehouse Date') or 
-                            booking_delivery)  # Use booking delivery as fallback
-        
-        row = {
-            'FORM_NO': i,
-            'IMAGE': '',
-            'SUPPLIER REFERENCE': base_data.get('Reference', '').upper() if base_data.get('Reference') else '',
-            'DESCRIPTION': base_data.get('Description', ''),
-            'COLOUR': base_data.get('Color', 'TBC'),
-            'UNITS': base_data.get('Total Units', ''),
-            'BOOKING FORM DELIVERY': booking_delivery,
-            'CONFIRMED DELIVERY': confirmed_delivery,
-            'VCP': base_data.get('VCP', ''),
-            'FACTORY': base_data.get('Factory', '') + " - " + base_data.get('Factory ID', '') if base_data.get('Factory ID', '') else base_data.get('Factory', ''),
-            'FABRIC COMP': '',  # Blank value as requested
-            'SUSTAINABLE MESSAGE': '',  # Blank value as requested
-            'COST': '',  # Blank value as requested
-            'REMARKS': f"Form {base_data.get('Form_Number', i)}"
-        }
-        order_rows.append(row)
+        cols['FORM_NO'].append(i)
+        cols['IMAGE'].append('')
+        cols['SUPPLIER REFERENCE'].append(reference.upper() if reference else '')
+        cols['DESCRIPTION'].append(base_data.get('Description', ''))
+        cols['COLOUR'].append(base_data.get('Color', 'TBC'))
+        cols['UNITS'].append(base_data.get('Total Units', ''))
+        cols['BOOKING FORM DELIVERY'].append(booking_delivery)
+        cols['CONFIRMED DELIVERY'].append(confirmed_delivery)
+        cols['VCP'].append(base_data.get('VCP', ''))
+        cols['FACTORY'].append(base_data.get('Factory Display', ''))
+        cols['FABRIC COMP'].append('')  # Blank value as requested
+        cols['SUSTAINABLE MESSAGE'].append('')  # Blank value as requested
+        cols['COST'].append('')  # Blank value as requested
+        cols['REMARKS'].append(f"Form {base_data.get('Form_Number', i)}")
     
-    return pd.DataFrame(order_rows)
+    if not cols['FORM_NO']:
+        # Every form was skipped: headers only, as object columns
+        return pd.DataFrame(columns=order_details_cols)
+    
+    return pd.DataFrame(cols, columns=order_details_cols)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _render_xlsx(order_df):
+    """Render the order details sheet to xlsx bytes, cached on the edited data"""
+    import xlsxwriter
+    
+    output = BytesIO()
+    # Every cell is written with an explicit format below, so write
+    # straight to the workbook rather than via pandas' to_excel pass.
+    # Cell text is written as-is: no URL or formula detection per string
+    workbook = xlsxwriter.Workbook(output, {'in_memory': True,
+                                            'strings_to_urls': False,
+                                            'strings_to_formulas': False})
+    worksheet = workbook.add_worksheet('Order Details')
+    
+    # Enhanced formatting
+    header_format = workbook.add_format({
+        'bold': True, 
+        'bg_color': '#4F8BF9', 
+        'font_color': 'white',
+        'border': 1,
+        'align': 'center',
+        'valign': 'vcenter'
+    })
+    cell_format = workbook.add_format({
+        'border': 1,
+        'align': 'left',
+        'valign': 'vcenter'
+    })
+    
+    # Longest text among each column's first 10 values (0 for an empty sheet)
+    sample = order_df.head(10).astype(str)
+    sample_widths = [max(sample.iloc[:, col_num].str.len(), default=0)
+                     for col_num in range(sample.shape[1])]
+    
+    # Set column widths and formatting
+    for col_num, value in enumerate(order_df.columns):
+        worksheet.write(0, col_num, value, header_format)
+        col_width = max(15, len(value) + 5, sample_widths[col_num] + 3)
+        worksheet.set_column(col_num, col_num, col_width)
+    
+    # Format data cells, a row at a time; cells cleared in the editor come
+    # back as NaN, which xlsxwriter rejects, so write them as blanks
+    rows = order_df.astype(object).where(order_df.notna(), None)
+    for row_num, row in enumerate(rows.itertuples(index=False, name=None), 1):
+        worksheet.write_row(row_num, 0, row, cell_format)
+    
+    workbook.close()
+    return output.getvalue()
 
 def allow_manual_edits(order_df):
     """Allow users to manually edit the generated data before final output"""
@@ -292,6 +881,40 @@ def allow_manual_edits(order_df):
     
     return edited_order
 
+def _form_details_html(base_data):
+    """Build the HTML for a form's expander: product, business and delivery details"""
+    def field(label, value):
+        # Line breaks as <br>, so a blank line can't end the markdown HTML block
+        text = '<br>'.join(html.escape(str(value)).splitlines())
+        return f'<div style="margin: 0.4rem 0;">{label}: {text}</div>'
+    
+    booking_delivery = _first_value(base_data, _BOOKING_DISPLAY_KEYS, 'N/A')
+    confirmed_delivery = _first_value(base_data, _CONFIRMED_DISPLAY_KEYS, 'N/A')
+    
+    return f'''
+        <div style="display: flex; gap: 1rem;">
+            <div style="flex: 1;">
+                <strong>Product Information:</strong>
+                {field("Description", base_data.get('Description', 'N/A'))}
+                {field("Reference", base_data.get('Reference', 'N/A'))}
+                {field("Look", base_data.get('Look', 'N/A'))}
+                {field("Color", base_data.get('Color', 'N/A'))}
+            </div>
+            <div style="flex: 1;">
+                <strong>Business Information:</strong>
+                {field("Factory", base_data.get('Factory', 'N/A'))}
+                {field("Supplier Ref", base_data.get('Supplier Reference', 'N/A'))}
+                {field("Total Units", base_data.get('Total Units', 'N/A'))}
+                {field("VCP", base_data.get('VCP', 'N/A'))}
+            </div>
+        </div>
+        <div style="margin-top: 1rem;"><strong>📅 Delivery Information:</strong></div>
+        <div style="display: flex; gap: 1rem;">
+            <div style="flex: 1;">{field("🚢 Booking Form Delivery", booking_delivery)}</div>
+            <div style="flex: 1;">{field("✅ Confirmed Delivery", confirmed_delivery)}</div>
+        </div>
+    '''
+
 def main():
     st.set_page_config(
         page_title="🚀 Jolanka AI Booking Processor", 
@@ -299,377 +922,10 @@ def main():
         page_icon="🚀",
         initial_sidebar_state="expanded"
     )
+    _load_env()
     
     # Professional Dark Theme CSS styling
-    st.markdown("""
-        <style>
-        @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700;800&family=JetBrains+Mono:wght@400;500;600&display=swap');
-        
-        /* Global dark theme override */
-        .stApp {
-            background: #0a0a0a !important;
-            color: #ffffff !important;
-        }
-        
-        .main {
-            background: #0a0a0a !important;
-            padding: 1rem 2rem !important;
-        }
-        
-        /* Container styling */
-        .block-container {
-            background: #0a0a0a !important;
-            padding: 1rem 2rem !important;
-            max-width: 1400px !important;
-        }
-        
-        /* Override all white backgrounds */
-        div[data-testid="stAppViewContainer"] {
-            background: #0a0a0a !important;
-        }
-        
-        div[data-testid="stHeader"] {
-            background: transparent !important;
-        }
-        
-        section[data-testid="stSidebar"] {
-            background: #111111 !important;
-        }
-        
-        /* Content wrapper */
-        .block-container {
-            background: transparent;
-            padding-top: 1rem;
-            padding-bottom: 1rem;
-        }
-        
-        /* Hide default Streamlit elements */
-        #MainMenu {visibility: hidden;}
-        footer {visibility: hidden;}
-        header {visibility: hidden;}
-        
-        /* Professional main title */
-        .main-title {
-            font-family: 'Inter', sans-serif;
-            font-size: 2.8rem;
-            font-weight: 800;
-            color: #ffffff;
-            text-align: center;
-            margin: 1.5rem 0 0.5rem 0;
-            letter-spacing: -0.02em;
-            text-shadow: 0 2px 4px rgba(0, 0, 0, 0.3);
-        }
-        
-        @keyframes gradientShift {
-            0% { background-position: 0% 50%; }
-            50% { background-position: 100% 50%; }
-            100% { background-position: 0% 50%; }
-        }
-        
-        /* Professional subtitle */
-        .sub-title {
-            font-family: 'Inter', sans-serif;
-            font-size: 1.1rem;
-            color: #94a3b8;
-            text-align: center;
-            margin-bottom: 2rem;
-            font-weight: 400;
-            letter-spacing: 0.01em;
-        }
-        
-        /* Professional card styling */
-        .modern-card {
-            background: #1a1a1a;
-            border: 1px solid #2d2d2d;
-            border-radius: 12px;
-            padding: 1.5rem;
-            margin: 1rem 0;
-            box-shadow: 0 4px 12px rgba(0, 0, 0, 0.1);
-            transition: all 0.3s ease;
-        }
-        
-        .modern-card:hover {
-            border-color: #3b82f6;
-            box-shadow: 0 8px 24px rgba(0, 0, 0, 0.2);
-            transform: translateY(-1px);
-        }
-        
-        /* Professional success message */
-        .success-message {
-            background: #065f46;
-            border: 1px solid #10b981;
-            border-radius: 8px;
-            padding: 1rem 1.5rem;
-            text-align: center;
-            font-weight: 500;
-            color: #d1fae5;
-            font-family: 'Inter', sans-serif;
-            margin: 1rem 0;
-        }
-        
-        @keyframes pulse {
-            0% { box-shadow: 0 0 20px rgba(0, 255, 128, 0.3); }
-            50% { box-shadow: 0 0 30px rgba(0, 255, 128, 0.5); }
-            100% { box-shadow: 0 0 20px rgba(0, 255, 128, 0.3); }
-        }
-        
-        /* Professional info message */
-        .info-message {
-            background: #1e3a8a;
-            border: 1px solid #3b82f6;
-            border-radius: 8px;
-            padding: 1rem 1.5rem;
-            text-align: center;
-            font-weight: 500;
-            color: #dbeafe;
-            font-family: 'Inter', sans-serif;
-            margin: 1rem 0;
-        }
-        
-        /* Warning message */
-        .warning-message {
-            background: linear-gradient(45deg, rgba(255, 165, 0, 0.1), rgba(255, 69, 0, 0.1));
-            border: 2px solid #ff8c00;
-            border-radius: 15px;
-            padding: 1.5rem;
-            text-align: center;
-            font-weight: 600;
-            color: #ff8c00;
-            box-shadow: 0 0 20px rgba(255, 140, 0, 0.3);
-        }
-        
-        /* Error message */
-        .error-message {
-            background: linear-gradient(45des, rgba(255, 0, 128, 0.1), rgba(255, 0, 0, 0.1));
-            border: 2px solid #ff0080;
-            border-radius: 15px;
-            padding: 1.5rem;
-            text-align: center;
-            font-weight: 600;
-            color: #ff0080;
-            box-shadow: 0 0 20px rgba(255, 0, 128, 0.3);
-        }
-        
-        /* Professional upload area */
-        .upload-container {
-            background: #1a1a1a;
-            border: 2px dashed #374151;
-            border-radius: 12px;
-            padding: 2rem;
-            text-align: center;
-            transition: all 0.3s ease;
-            margin: 1.5rem 0;
-        }
-        
-        .upload-container:hover {
-            border-color: #3b82f6;
-            background: #1e1e1e;
-            box-shadow: 0 4px 12px rgba(59, 130, 246, 0.1);
-        }
-        
-        /* File uploader styling */
-        .stFileUploader {
-            background: transparent !important;
-        }
-        
-        .stFileUploader > div {
-            background: #1a1a1a !important;
-            border: 2px dashed #374151 !important;
-            border-radius: 12px !important;
-            padding: 2rem !important;
-        }
-        
-        .stFileUploader > div:hover {
-            border-color: #3b82f6 !important;
-            background: #1e1e1e !important;
-        }
-        
-        .stFileUploader label {
-            color: #ffffff !important;
-            font-family: 'Inter', sans-serif !important;
-            font-weight: 500 !important;
-        }
-        
-        /* Data frames and tables */
-        .dataframe {
-            background: rgba(255, 255, 255, 0.05) !important;
-            color: #ffffff !important;
-            border-radius: 15px !important;
-        }
-        
-        .dataframe th {
-            background: rgba(0, 245, 255, 0.2) !important;
-            color: #00f5ff !important;
-            border: 1px solid rgba(0, 245, 255, 0.3) !important;
-        }
-        
-        .dataframe td {
-            background: rgba(255, 255, 255, 0.02) !important;
-            color: rgba(255, 255, 255, 0.9) !important;
-            border: 1px solid rgba(0, 245, 255, 0.1) !important;
-        }
-        
-        /* Expander content background */
-        .streamlit-expanderContent {
-            background: rgba(0, 0, 0, 0.3) !important;
-            border-radius: 0 0 15px 15px;
-        }
-        
-        /* Stats container */
-        .stats-container {
-            display: flex;
-            justify-content: space-around;
-            margin: 2rem 0;
-        }
-        
-        .stat-item {
-            background: rgba(255, 255, 255, 0.05);
-            border: 1px solid rgba(0, 245, 255, 0.3);
-            border-radius: 15px;
-            padding: 1.5rem;
-            text-align: center;
-            min-width: 150px;
-            backdrop-filter: blur(5px);
-        }
-        
-        .stat-number {
-            font-family: 'Orbitron', monospace;
-            font-size: 2rem;
-            font-weight: 700;
-            color: #00f5ff;
-            margin-bottom: 0.5rem;
-        }
-        
-        .stat-label {
-            font-family: 'Roboto', sans-serif;
-            color: rgba(255, 255, 255, 0.8);
-            font-size: 0.9rem;
-        }
-        
-        /* Professional button styling */
-        .stButton > button {
-            background: #3b82f6;
-            border: none;
-            border-radius: 8px;
-            padding: 0.75rem 1.5rem;
-            font-family: 'Inter', sans-serif;
-            font-weight: 500;
-            color: white;
-            transition: all 0.2s ease;
-            font-size: 0.95rem;
-        }
-        
-        .stButton > button:hover {
-            background: #2563eb;
-            transform: translateY(-1px);
-            box-shadow: 0 4px 12px rgba(59, 130, 246, 0.3);
-        }
-        
-        .stDownloadButton > button {
-            background: #10b981;
-            border: none;
-            border-radius: 8px;
-            padding: 0.75rem 1.5rem;
-            font-family: 'Inter', sans-serif;
-            font-weight: 500;
-            color: white;
-            transition: all 0.2s ease;
-        }
-        
-        .stDownloadButton > button:hover {
-            background: #059669;
-            transform: translateY(-1px);
-            box-shadow: 0 4px 12px rgba(16, 185, 129, 0.3);
-        }
-        
-        /* Sidebar styling */
-        .css-1d391kg, .css-1y4p8pa, .css-17eq0hr {
-            background: linear-gradient(180deg, #0a0a1f 0%, #1a1a2e 50%, #2d1b69 100%) !important;
-        }
-        
-        /* Sidebar content */
-        .css-1d391kg .element-container {
-            background: transparent;
-        }
-        
-        /* Remove white backgrounds from all containers */
-        .element-container, .stMarkdown, .stText {
-            background: transparent !important;
-        }
-        
-        /* File uploader styling */
-        .stFileUploader {
-            background: rgba(0, 245, 255, 0.05) !important;
-            border-radius: 15px;
-            border: 2px dashed rgba(0, 245, 255, 0.3);
-            padding: 2rem;
-        }
-        
-        .stFileUploader label {
-            color: #00f5ff !important;
-            font-weight: 600;
-        }
-        
-        /* Text styling */
-        p, span, div {
-            color: rgba(255, 255, 255, 0.9) !important;
-        }
-        
-        h1, h2, h3, h4, h5, h6 {
-            color: #00f5ff !important;
-        }
-        
-        /* Remove default streamlit styling */
-        .css-1v0mbdj, .css-18e3th9, .css-1d391kg {
-            background: transparent !important;
-        }
-        
-        /* Data editor styling */
-        .stDataFrame {
-            border-radius: 15px;
-            overflow: hidden;
-            box-shadow: 0 8px 32px rgba(0, 245, 255, 0.1);
-        }
-        
-        /* Progress bar */
-        .progress-container {
-            background: rgba(255, 255, 255, 0.1);
-            border-radius: 10px;
-            padding: 0.5rem;
-            margin: 1rem 0;
-        }
-        
-        .progress-bar {
-            background: linear-gradient(90deg, #00f5ff, #8000ff);
-            height: 8px;
-            border-radius: 4px;
-            transition: width 0.3s ease;
-        }
-        
-        /* Expander styling */
-        .streamlit-expanderHeader {
-            background: rgba(0, 245, 255, 0.1);
-            border-radius: 10px;
-            border: 1px solid rgba(0, 245, 255, 0.3);
-        }
-        
-        /* Custom text colors */
-        .highlight-text {
-            color: #00f5ff;
-            font-weight: 600;
-        }
-        
-        .accent-text {
-            color: #ff0080;
-            font-weight: 500;
-        }
-        
-        .success-text {
-            color: #00ff80;
-            font-weight: 500;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    st.markdown(_CSS, unsafe_allow_html=True)
 
     # Main header with single logo and animation
     st.markdown('''
@@ -810,41 +1066,28 @@ def main():
         status_text = st.empty()
         
         try:
-            status_text.text("🔍 Analyzing file format...")
-            progress_bar.progress(20)
-            # Choose the appropriate engine based on file extension
             file_extension = uploaded_excel.name.split('.')[-1].lower()
             
-            if file_extension == 'xls':
-                engine = 'xlrd'
-            else:  # xlsx or other formats
-                engine = 'openpyxl'
-            
-            status_text.text("📊 Loading Excel data...")
-            progress_bar.progress(40)
-            
-            # Read Excel file - using the appropriate engine
-            df = pd.read_excel(uploaded_excel, header=None, engine=engine)
-            
-            status_text.text("🤖 AI Processing booking forms...")
-            progress_bar.progress(60)
+            status_text.text("📊 Loading Excel data and processing booking forms...")
+            progress_bar.progress(20)
             
-            # Extract data from multiple booking forms
-            base_data_list, lot_data = extract_multi_lot_data(df)
+            # Read, extract and process the booking forms once per upload; later
+            # reruns reuse the session's copy without re-hashing the file bytes
+            if st.session_state.get('upload_id') != uploaded_excel.file_id:
+                st.session_state['upload_data'] = _load_and_extract(uploaded_excel.getvalue(), file_extension)
+                st.session_state['upload_id'] = uploaded_excel.file_id
+            df, processed_base_data, lot_data = st.session_state['upload_data']
             
             status_text.text("✨ Finalizing data extraction...")
             progress_bar.progress(80)
             
-            if base_data_list:
-                # Process the extracted data
-                processed_base_data = process_form_data(base_data_list)
-                
+            if processed_base_data:
                 progress_bar.progress(100)
                 status_text.text("🎯 Extraction Complete!")
                 
                 # Enhanced success display with statistics
                 valid_forms = len(processed_base_data)
-                total_units = sum(int(form.get('Total Units', '0').replace(',', '') or '0') for form in processed_base_data if form.get('Total Units', '0').replace(',', '').isdigit())
+                total_units = _sum_total_units(processed_base_data)  # Reused by the download stats
                 
                 st.markdown(f'''
                     <div class="success-message">
@@ -884,43 +1127,22 @@ def main():
                     form_desc = base_data.get('Description', 'No Description')
                     
                     with st.expander(f"🎯 Form {i}: {form_ref} | {form_desc[:50]}{'...' if len(form_desc) > 50 else ''}"):
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            st.write("**Product Information:**")
-                            st.write(f"Description: {base_data.get('Description', 'N/A')}")
-                            st.write(f"Reference: {base_data.get('Reference', 'N/A')}")
-                            st.write(f"Look: {base_data.get('Look', 'N/A')}")
-                            st.write(f"Color: {base_data.get('Color', 'N/A')}")
-                        with col2:
-                            st.write("**Business Information:**")
-                            st.write(f"Factory: {base_data.get('Factory', 'N/A')}")
-                            st.write(f"Supplier Ref: {base_data.get('Supplier Reference', 'N/A')}")
-                            st.write(f"Total Units: {base_data.get('Total Units', 'N/A')}")
-                            st.write(f"VCP: {base_data.get('VCP', 'N/A')}")
-                        
-                        # Show delivery dates in a separate section
-                        st.write("**📅 Delivery Information:**")
-                        delivery_col1, delivery_col2 = st.columns(2)
-                        with delivery_col1:
-                            booking_delivery = (base_data.get('Booking Form Delivery_Formatted') or 
-                                              base_data.get('Booking Form Delivery') or 
-                                              base_data.get('Ship Date_Formatted') or 
-                                              base_data.get('Ship Date') or 'N/A')
-                            st.write(f"🚢 Booking Form Delivery: {booking_delivery}")
-                        with delivery_col2:
-                            confirmed_delivery = (base_data.get('Confirmed Delivery_Formatted') or 
-                                                base_data.get('Confirmed Delivery') or 
-                                                base_data.get('Warehouse Date_Formatted') or 
-                                                base_data.get('Warehouse Date') or 'N/A')
-                            st.write(f"✅ Confirmed Delivery: {confirmed_delivery}")
+                        # All of the form's details in one element rather than a write per field
+                        st.markdown(_form_details_html(base_data), unsafe_allow_html=True)
                 
                 # Show debug information
                 with st.expander("🔍 Debug Information"):
-                    st.write("**Raw Data Preview:**")
-                    st.dataframe(df.head(10))
                     st.write("**Forms Found:**", len(processed_base_data))
-                    for i, data in enumerate(processed_base_data):
-                        st.write(f"Form {i+1} fields:", list(data.keys()))
+                    # Expander contents are built even while collapsed, so the
+                    # previews are only serialised once asked for
+                    if st.checkbox("Show raw data and extracted fields", key="show_debug"):
+                        st.write("**Raw Data Preview:**")
+                        st.dataframe(df.head(10))
+                        # One table instead of a st.write message per form
+                        st.dataframe(pd.DataFrame({
+                            'Form': range(1, len(processed_base_data) + 1),
+                            'Fields': [', '.join(data.keys()) for data in processed_base_data],
+                        }), hide_index=True, use_container_width=True)
                 
                 # Generate output sheet (one row per form)
                 order_df = create_order_details_output_multi_form(processed_base_data)
@@ -928,104 +1150,64 @@ def main():
                 # Allow manual editing
                 edited_order = allow_manual_edits(order_df)
                 
-                # Enhanced generate button with modern styling
+                # Final processing card with modern styling
                 st.markdown('''
                     <div class="modern-card">
                         <h3 style="color: #00f5ff; text-align: center; margin-bottom: 1rem;">
                             🚀 FINAL PROCESSING
                         </h3>
                         <p style="color: rgba(255,255,255,0.8); text-align: center; margin-bottom: 2rem;">
-                            Generate your final Excel file with all processed booking forms
+                            Download your final Excel file with all processed booking forms
                         </p>
                     </div>
                 ''', unsafe_allow_html=True)
                 
-                # Create Excel output with enhanced button
-                if st.button("🚀 Generate Order Processing Sheet", type="primary", use_container_width=True):
-                    # Show processing animation
-                    with st.spinner("🔄 Generating Excel file..."):
-                        output = BytesIO()
-                        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                            edited_order.to_excel(writer, sheet_name='Order Details', index=False)
-                            
-                            # Enhanced formatting
-                            workbook = writer.book
-                            header_format = workbook.add_format({
-                                'bold': True, 
-                                'bg_color': '#4F8BF9', 
-                                'font_color': 'white',
-                                'border': 1,
-                                'align': 'center',
-                                'valign': 'vcenter'
-                            })
-                            cell_format = workbook.add_format({
-                                'border': 1,
-                                'align': 'left',
-                                'valign': 'vcenter'
-                            })
-                            
-                            # Format the worksheet
-                            worksheet = writer.sheets['Order Details']
-                            
-                            # Set column widths and formatting
-                            for col_num, value in enumerate(edited_order.columns):
-                                worksheet.write(0, col_num, value, header_format)
-                                col_width = max(15, len(value) + 5, 
-                                              max(len(str(edited_order.iloc[row, col_num])) 
-                                                  for row in range(min(len(edited_order), 10))) + 3)
-                                worksheet.set_column(col_num, col_num, col_width)
-                            
-                            # Format data cells
-                            for row_num in range(1, len(edited_order) + 1):
-                                for col_num in range(len(edited_order.columns)):
-                                    worksheet.write(row_num, col_num, 
-                                                  edited_order.iloc[row_num-1, col_num], cell_format)
-                        
-                        output.seek(0)
-                    
-                    # Enhanced success message with download stats
-                    total_forms = len(processed_base_data)
-                    total_units = sum(int(form.get('Total Units', '0').replace(',', '') or '0') 
-                                    for form in processed_base_data 
-                                    if form.get('Total Units', '0').replace(',', '').isdigit())
-                    
-                    st.markdown(f'''
-                        <div class="success-message">
-                            <h3>🎉 EXCEL FILE GENERATED SUCCESSFULLY!</h3>
-                            <div class="stats-container">
-                                <div class="stat-item">
-                                    <div class="stat-number">{total_forms}</div>
-                                    <div class="stat-label">Forms Included</div>
-                                </div>
-                                <div class="stat-item">
-                                    <div class="stat-number">{len(edited_order)}</div>
-                                    <div class="stat-label">Data Rows</div>
-                                </div>
-                                <div class="stat-item">
-                                    <div class="stat-number">{total_units:,}</div>
-                                    <div class="stat-label">Total Units</div>
-                                </div>
-                                <div class="stat-item">
-                                    <div class="stat-number">{output.getvalue().__len__()//1024}</div>
-                                    <div class="stat-label">KB Size</div>
-                                </div>
+                # Render the Excel output up front, so the download button is live
+                # on every rerun; cached on the frame's contents, so reruns
+                # without edits reuse the same bytes
+                with st.spinner("🔄 Generating Excel file..."):
+                    xlsx_bytes = _render_xlsx(edited_order)
+                
+                # Enhanced success message with download stats
+                total_forms = len(processed_base_data)
+                
+                st.markdown(f'''
+                    <div class="success-message">
+                        <h3>🎉 EXCEL FILE GENERATED SUCCESSFULLY!</h3>
+                        <div class="stats-container">
+                            <div class="stat-item">
+                                <div class="stat-number">{total_forms}</div>
+                                <div class="stat-label">Forms Included</div>
+                            </div>
+                            <div class="stat-item">
+                                <div class="stat-number">{len(edited_order)}</div>
+                                <div class="stat-label">Data Rows</div>
+                            </div>
+                            <div class="stat-item">
+                                <div class="stat-number">{total_units:,}</div>
+                                <div class="stat-label">Total Units</div>
+                            </div>
+                            <div class="stat-item">
+                                <div class="stat-number">{len(xlsx_bytes)//1024}</div>
+                                <div class="stat-label">KB Size</div>
                             </div>
                         </div>
-                    ''', unsafe_allow_html=True)
-                    
-                    # Generate filename from first form or use generic name
-                    first_ref = processed_base_data[0].get('Reference', 'multi_form') if processed_base_data else 'multi_form'
-                    filename = f"order_processing_{first_ref.upper()}_forms.xlsx"
-                    
-                    # Enhanced download button
-                    st.download_button(
-                        label="📥 Download Multi-Form Order Processing Excel",
-                        data=output,
-                        file_name=filename,
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        key="download_button",
-                        use_container_width=True
-                    )
+                    </div>
+                ''', unsafe_allow_html=True)
+                
+                # Generate filename from first form or use generic name
+                first_ref = processed_base_data[0].get('Reference', 'multi_form') if processed_base_data else 'multi_form'
+                filename = f"order_processing_{first_ref.upper()}_forms.xlsx"
+                
+                # Enhanced download button
+                st.download_button(
+                    label="📥 Download Multi-Form Order Processing Excel",
+                    data=xlsx_bytes,
+                    file_name=filename,
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    key="download_button",
+                    use_container_width=True
+                )
             else:
                 st.markdown('''
                     <div class="warning-message">
@@ -1076,7 +1258,6 @@ def main():
             
             # Enhanced troubleshooting section
             with st.expander("🔧 Advanced Troubleshooting"):
-                import traceback
                 st.code(traceback.format_exc(), language="python")
             
             # Modern troubleshooting guide